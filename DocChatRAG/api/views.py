@@ -1,12 +1,13 @@
 import os
 import tempfile
 import urllib.request
+from asgiref.sync import async_to_sync
 from rest_framework import status
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework.response import Response
 
-from ingestion.pipeline import ingestion_pipeline
+from ingestion.pipeline import get_ingestion_pipeline
 
 
 @api_view(['POST'])
@@ -19,12 +20,22 @@ def ingest_view(request):
       - url: String URL to ingest
       - type: Optional, force source type (pdf, docx, csv, text, web, image)
     """
+    pipeline = get_ingestion_pipeline()
     source = None
     source_type = request.data.get('type')
 
     # Handle file upload
     if 'file' in request.FILES:
         uploaded = request.FILES['file']
+        upload_type = source_type or pipeline._detect_source_type(uploaded.name)
+
+        # Parse text, CSV and PDF uploads in place, without a temp-file round-trip
+        if upload_type in pipeline.STREAM_SOURCE_TYPES:
+            result = async_to_sync(pipeline.aprocess_stream)(
+                uploaded.file, uploaded.name, upload_type
+            )
+            return _ingest_response(result)
+
         # Save temporarily to disk
         suffix = os.path.splitext(uploaded.name)[1]
         with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
@@ -42,8 +53,8 @@ def ingest_view(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Run ingestion pipeline
-    result = ingestion_pipeline.process_source(source, source_type)
+    # Run ingestion pipeline; embedding requests are issued concurrently
+    result = async_to_sync(pipeline.aprocess_source)(source, source_type)
 
     # If we wrote a temp file, clean up
     if os.path.isfile(source) and source.startswith(tempfile.gettempdir()):
@@ -52,6 +63,11 @@ def ingest_view(request):
         except Exception:
             pass
 
+    return _ingest_response(result)
+
+
+def _ingest_response(result):
+    """Map a pipeline result to an HTTP response"""
     if result.get('success'):
         return Response(result, status=status.HTTP_200_OK)
     else:
@@ -1,28 +1,82 @@
+import io
 import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from operator import itemgetter
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
+from langchain_community.chat_message_histories import RedisChatMessageHistory
 from langchain_huggingface import HuggingFaceEndpoint
 from retrieval.store import vector_store_manager
 
-# Simple in-memory store; replace with RedisChatMessageHistory for production
-_store = {}
+# Per-process fallback when REDIS_URL is unset, bounded with LRU eviction
+_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+_store = OrderedDict()
+_store_lock = threading.Lock()
 
 def get_session_history(session_id: str) -> BaseChatMessageHistory:
-    from langchain_core.chat_history import InMemoryChatMessageHistory
-    if session_id not in _store:
-        _store[session_id] = InMemoryChatMessageHistory()
-    return _store[session_id]
+    redis_url = os.getenv("REDIS_URL")
+    if redis_url:
+        # Shared across workers, so sessions are not pinned to one process.
+        # Needs the optional redis extra
+        return RedisChatMessageHistory(
+            session_id=session_id,
+            url=redis_url,
+            ttl=int(os.getenv("CHAT_HISTORY_TTL", "3600"))
+        )
+
+    with _store_lock:
+        if session_id in _store:
+            _store.move_to_end(session_id)
+        else:
+            _store[session_id] = InMemoryChatMessageHistory()
+            if len(_store) > _MAX_SESSIONS:
+                _store.popitem(last=False)
+        return _store[session_id]
+
+# Upper bound on retrieved context sent to the LLM, in tokens
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "3000"))
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    # tiktoken is optional (the tokens extra) and downloads its BPE table on first use
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+def _count_tokens(texts):
+    encoding = _get_encoding()
+    if encoding is None:
+        # Rough estimate for English text: ~4 characters per token
+        return [len(text) // 4 + 1 for text in texts]
+    # Retrieved text may contain special-token strings like <|endoftext|>;
+    # count them as plain text rather than raising
+    return [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
 
 def format_docs(docs):
-    return "\n\n".join(f"[{i+1}] {d.page_content}\nSOURCE: {d.metadata.get('source')}"
-                       for i, d in enumerate(docs))
+    parts = [f"[{i+1}] {d.page_content}\nSOURCE: {d.metadata.get('source')}"
+             for i, d in enumerate(docs)]
+
+    # Keep the highest-ranked documents that fit in the token budget
+    context = io.StringIO()
+    total = 0
+    for i, (part, tokens) in enumerate(zip(parts, _count_tokens(parts))):
+        if i and total + tokens > MAX_CONTEXT_TOKENS:
+            break
+        if i:
+            context.write("\n\n")
+        context.write(part)
+        total += tokens
+    return context.getvalue()
 
 def build_chain():
     retriever = vector_store_manager.get_retriever({"k": 4})
@@ -59,3 +113,17 @@ def build_chain():
         history_messages_key="history",
     )
     return with_history
+
+
+# Process-local chain, built on first use rather than at import time
+_chain = None
+_chain_lock = threading.Lock()
+
+
+def get_chain():
+    """Return the shared RAG chain, building it on first call"""
+    global _chain
+    with _chain_lock:
+        if _chain is None:
+            _chain = build_chain()
+        return _chain
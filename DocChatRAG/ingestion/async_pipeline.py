@@ -0,0 +1,384 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+from tqdm import tqdm
+from langchain_core.documents import Document
+from ingestion.web import afetch_web_documents, afetch_web_fingerprint, async_web_client
+from retrieval.embeddings import length_sorted_batches
+from retrieval.store import vector_store_manager
+
+logger = logging.getLogger(__name__)
+
+# Sentinel telling a stage worker that upstream has finished
+_DONE = object()
+
+# Loader processes must not be forked from this one, which by then runs
+# threads (asyncio.to_thread, the I/O pool, Chroma's client). Forkserver
+# workers fork from a clean server that has preloaded the pipeline modules.
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    _MP_CONTEXT = multiprocessing.get_context('forkserver')
+    _MP_CONTEXT.set_forkserver_preload(['ingestion.async_pipeline'])
+else:
+    _MP_CONTEXT = multiprocessing.get_context('spawn')
+
+
+def _load_and_split(pipeline, source: str, source_type: str) -> Tuple[int, List[Document]]:
+    """Load and split one source inside a worker process.
+
+    Returns the number of loaded documents and the resulting chunks; the
+    loaded documents themselves stay in the worker.
+    """
+    documents = pipeline.load_document(source, source_type)
+    return len(documents), pipeline.split_documents(documents) if documents else []
+
+
+async def _dispatch_chunks(pipeline, source: str, chunks: List[Document],
+                           out_queue: asyncio.Queue, stats: Dict[str, Dict[str, Any]],
+                           batch_size: int) -> None:
+    """Drop already-stored chunks and queue the rest as length-sorted micro-batches"""
+    try:
+        new_chunks = await asyncio.to_thread(pipeline._filter_new_chunks, chunks)
+    except Exception as e:
+        logger.error(f"Failed to check existing chunks from {source}: {e}")
+        stats[source]['error'] = f"Failed to store documents: {e}"
+        return
+
+    stats[source]['chunks'] = chunks
+    stats[source]['skipped'] = len(chunks) - len(new_chunks)
+    # Counted down as chunks are stored; the source is complete at zero
+    stats[source]['pending'] = len(new_chunks)
+
+    # Each micro-batch is its own queue item, so one large source is
+    # embedded by all embedding workers at once
+    texts = [chunk.page_content for chunk in new_chunks]
+    for indices in length_sorted_batches(texts, batch_size):
+        await out_queue.put((source, [new_chunks[i] for i in indices]))
+
+
+async def load_stage(pipeline, executor: ProcessPoolExecutor, io_executor: ThreadPoolExecutor,
+                     in_queue: asyncio.Queue, out_queue: asyncio.Queue,
+                     stats: Dict[str, Dict[str, Any]], progress: tqdm,
+                     batch_size: int) -> None:
+    """Load and split each source and pass its new chunks downstream.
+
+    Sources that are cheap to parse are read on the I/O thread pool and only
+    split in the process pool; the rest are loaded and split in a worker process.
+    """
+    loop = asyncio.get_running_loop()
+
+    while True:
+        item = await in_queue.get()
+        if item is _DONE:
+            break
+
+        source, source_type = item
+        try:
+            fingerprint = await asyncio.to_thread(pipeline._source_fingerprint, source, source_type)
+            if await asyncio.to_thread(pipeline._is_unchanged, source, fingerprint):
+                stats[source]['cached'] = True
+                continue
+            stats[source]['fingerprint'] = fingerprint
+
+            if source_type in pipeline.IO_BOUND_SOURCE_TYPES:
+                documents = await loop.run_in_executor(
+                    io_executor, pipeline.load_document, source, source_type
+                )
+                document_count = len(documents)
+                chunks = await loop.run_in_executor(
+                    executor, pipeline.split_documents, documents
+                ) if documents else []
+            else:
+                document_count, chunks = await loop.run_in_executor(
+                    executor, _load_and_split, pipeline, source, source_type
+                )
+        except Exception as e:
+            logger.error(f"Failed to load and split {source}: {e}")
+            stats[source]['error'] = f"Pipeline failed for {source}: {e}"
+            continue
+        finally:
+            progress.update()
+
+        stats[source]['original_documents'] = document_count
+        stats[source]['total_chunks'] = len(chunks)
+
+        if not document_count:
+            stats[source]['error'] = 'No documents loaded'
+            continue
+        if not chunks:
+            stats[source]['error'] = 'No chunks created'
+            continue
+
+        await _dispatch_chunks(pipeline, source, chunks, out_queue, stats, batch_size)
+
+
+async def web_load_stage(pipeline, executor: ProcessPoolExecutor, urls: List[str],
+                         out_queue: asyncio.Queue, stats: Dict[str, Dict[str, Any]],
+                         progress: tqdm, batch_size: int, max_concurrency: int = 16) -> None:
+    """Fetch web sources concurrently over one async client, then split them"""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async with async_web_client(max_concurrency) as client:
+        async def load(url: str) -> None:
+            try:
+                async with semaphore:
+                    fingerprint = await afetch_web_fingerprint(client, url)
+                    if await asyncio.to_thread(pipeline._is_unchanged, url, fingerprint):
+                        stats[url]['cached'] = True
+                        return
+                    stats[url]['fingerprint'] = fingerprint
+                    documents = await afetch_web_documents(client, url)
+                pipeline._add_source_metadata(documents, url, 'web')
+                chunks = await loop.run_in_executor(
+                    executor, pipeline.split_documents, documents
+                )
+            except Exception as e:
+                logger.error(f"Failed to load document from {url}: {e}")
+                stats[url]['error'] = f"Pipeline failed for {url}: {e}"
+                return
+            finally:
+                progress.update()
+
+            stats[url]['original_documents'] = len(documents)
+            stats[url]['total_chunks'] = len(chunks)
+
+            if not documents:
+                stats[url]['error'] = 'No documents loaded'
+                return
+            if not chunks:
+                stats[url]['error'] = 'No chunks created'
+                return
+
+            await _dispatch_chunks(pipeline, url, chunks, out_queue, stats, batch_size)
+
+        await asyncio.gather(*[load(url) for url in urls])
+
+
+async def embed_stage(in_queue: asyncio.Queue, out_queue: asyncio.Queue,
+                      stats: Dict[str, Dict[str, Any]]) -> None:
+    """Embed micro-batches of chunks and pass chunk/vector pairs downstream"""
+    while True:
+        item = await in_queue.get()
+        if item is _DONE:
+            break
+
+        source, batch = item
+        if stats[source]['error']:
+            # An earlier batch of this source failed; it will not be finalized anyway
+            continue
+
+        try:
+            vectors = await vector_store_manager.embeddings.aembed_documents(
+                [chunk.page_content for chunk in batch]
+            )
+        except Exception as e:
+            logger.error(f"Failed to embed chunks from {source}: {e}")
+            stats[source]['error'] = f"Failed to store documents: {e}"
+            continue
+
+        await out_queue.put((source, batch, np.asarray(vectors, dtype=np.float32)))
+
+
+async def upsert_stage(pipeline, in_queue: asyncio.Queue,
+                       stats: Dict[str, Dict[str, Any]], batch_size: int,
+                       loaded: asyncio.Event) -> None:
+    """Aggregate embedded chunks into larger write batches for the vector store.
+
+    Once every source is split, a bulk write holds off HNSW syncs for the
+    chunks still to be written, as store_documents does.
+    """
+    # Keyed by chunk id, so each chunk is written once
+    pending: Dict[str, tuple] = {}
+    deferral_checked = False
+
+    async with AsyncExitStack() as deferral:
+        async def defer_index_sync() -> None:
+            remaining = sum(source_stats['pending'] for source_stats in stats.values())
+            try:
+                await deferral.enter_async_context(
+                    vector_store_manager.adeferred_index_sync(remaining)
+                )
+            except Exception as e:
+                logger.error(f"Failed to defer index syncs: {e}")
+
+        async def flush() -> None:
+            nonlocal deferral_checked
+            if not deferral_checked and loaded.is_set():
+                deferral_checked = True
+                await defer_index_sync()
+
+            entries = list(pending.values())
+            sources = [source for source, _, _ in entries]
+            chunks: List[Document] = [chunk for _, chunk, _ in entries]
+            try:
+                await asyncio.to_thread(
+                    pipeline.vector_store._collection.upsert,
+                    ids=list(pending),
+                    embeddings=np.stack([vector for _, _, vector in entries]),
+                    documents=[chunk.page_content for chunk in chunks],
+                    metadatas=[chunk.metadata for chunk in chunks]
+                )
+                for source in sources:
+                    stats[source]['stored'] += 1
+                    stats[source]['pending'] -= 1
+            except Exception as e:
+                logger.error(f"Failed to store documents: {e}")
+                for source in set(sources):
+                    stats[source]['error'] = f"Failed to store documents: {e}"
+            pending.clear()
+
+        while True:
+            item = await in_queue.get()
+            if item is _DONE:
+                break
+
+            source, batch, vectors = item
+            for chunk, vector in zip(batch, vectors):
+                pending.setdefault(chunk.metadata['content_hash'], (source, chunk, vector))
+
+            if len(pending) >= batch_size:
+                await flush()
+
+        if pending:
+            await flush()
+
+
+async def _run_stage(workers: List, out_queue: asyncio.Queue = None,
+                     downstream_workers: int = 0, finished: asyncio.Event = None) -> None:
+    """Wait for a stage's workers, then signal the next stage to stop"""
+    await asyncio.gather(*workers)
+    if finished is not None:
+        finished.set()
+    for _ in range(downstream_workers):
+        await out_queue.put(_DONE)
+
+
+async def run_staged_ingestion(pipeline, sources: List[Dict[str, str]],
+                               queue_size: int = 8,
+                               load_workers: int = None,
+                               io_workers: int = 16,
+                               embed_workers: int = 8,
+                               embed_batch_size: int = 64,
+                               upsert_batch_size: int = None) -> List[Dict[str, Any]]:
+    """Run load/split -> embed -> upsert as overlapping stages.
+
+    File sources are loaded and split in parallel worker processes, since PDF
+    and docx parsing is CPU-bound; plain text and CSV files are read on a
+    thread pool so disk waits overlap. Web sources are fetched concurrently
+    over a single async HTTP client. Their new chunks then funnel, as
+    micro-batches, through one shared pool of embedding workers, which caps the
+    load on the endpoint, and on to batched vector-store writes. Stages hand work over bounded queues.
+    Returns one result per source, in the same shape as process_source.
+    """
+    load_workers = load_workers or os.cpu_count() or 1
+    upsert_batch_size = upsert_batch_size or vector_store_manager.upsert_batch_size
+
+    stats = {}
+    for config in sources:
+        stats[config.get('source')] = {
+            'source_type': config.get('type'),
+            'original_documents': 0,
+            'total_chunks': 0,
+            'stored': 0,
+            'skipped': 0,
+            'cached': False,
+            'chunks': None,
+            'pending': 0,
+            'fingerprint': {},
+            'error': None
+        }
+
+    source_queue = asyncio.Queue()
+    chunks_queue = asyncio.Queue(maxsize=queue_size)
+    vectors_queue = asyncio.Queue(maxsize=queue_size)
+    # Set once every source is split, when the total chunk count is known
+    loaded = asyncio.Event()
+
+    # Web pages are fetched over async HTTP; everything else goes to the process pool
+    urls = []
+    queued = 0
+    for source, source_stats in stats.items():
+        try:
+            source_stats['source_type'] = (source_stats['source_type']
+                                           or pipeline._detect_source_type(source))
+        except Exception as e:
+            logger.error(f"Failed to load document from {source}: {e}")
+            source_stats['error'] = 'No documents loaded'
+            continue
+
+        queued += 1
+        if source_stats['source_type'] == 'web':
+            urls.append(source)
+        else:
+            source_queue.put_nowait((source, source_stats['source_type']))
+
+    # Enough load workers to keep the I/O pool busy; CPU-bound loads queue in the process pool
+    load_stage_workers = max(load_workers, io_workers)
+    for _ in range(load_stage_workers):
+        source_queue.put_nowait(_DONE)
+
+    with ProcessPoolExecutor(max_workers=load_workers, mp_context=_MP_CONTEXT) as executor, \
+            ThreadPoolExecutor(max_workers=io_workers) as io_executor, \
+            tqdm(total=queued, desc='Loading sources', disable=None) as progress:
+        await asyncio.gather(
+            _run_stage(
+                [load_stage(pipeline, executor, io_executor, source_queue, chunks_queue,
+                            stats, progress, embed_batch_size)
+                 for _ in range(load_stage_workers)]
+                + [web_load_stage(pipeline, executor, urls, chunks_queue, stats, progress,
+                                  embed_batch_size)],
+                chunks_queue, embed_workers, loaded
+            ),
+            _run_stage(
+                [embed_stage(chunks_queue, vectors_queue, stats)
+                 for _ in range(embed_workers)],
+                vectors_queue, 1
+            ),
+            _run_stage([upsert_stage(pipeline, vectors_queue, stats, upsert_batch_size, loaded)])
+        )
+
+    # Only sources whose new chunks were all written are finalized
+    for source, source_stats in stats.items():
+        if source_stats['chunks'] is None or source_stats['error'] or source_stats['pending']:
+            continue
+        try:
+            await asyncio.to_thread(pipeline._finalize_source, source,
+                                    source_stats['chunks'], source_stats['fingerprint'])
+        except Exception as e:
+            logger.error(f"Failed to finalize {source}: {e}")
+            source_stats['error'] = f"Failed to store documents: {e}"
+
+    results = []
+    for config in sources:
+        source = config.get('source')
+        if stats[source]['cached']:
+            results.append(pipeline._unchanged_result(source, stats[source]['source_type']))
+        else:
+            results.append(_source_result(source, stats[source]))
+    return results
+
+
+def _source_result(source: str, source_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert per-source stage statistics into a process_source style result"""
+    if source_stats['error']:
+        return {'success': False, 'message': source_stats['error']}
+
+    return {
+        'success': True,
+        'message': f"Successfully stored {source_stats['stored']} document chunks",
+        'chunk_count': source_stats['stored'],
+        'skipped_chunks': source_stats['skipped'],
+        'sources': [source],
+        'processing_summary': {
+            'source': source,
+            'source_type': source_stats['source_type'],
+            'original_documents': source_stats['original_documents'],
+            'total_chunks': source_stats['total_chunks']
+        }
+    }
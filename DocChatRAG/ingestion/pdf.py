@@ -0,0 +1,54 @@
+from typing import List, Union
+
+from langchain_core.document_loaders import BaseLoader
+from langchain_core.documents import Document
+from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+
+def _mupdf_pages(pdf) -> List[Document]:
+    """One document per page of an open MuPDF document"""
+    # MuPDF documents are not thread-safe, so pages are read in order;
+    # parallelism across files comes from the staged pipeline's process pool
+    with pdf:
+        return [
+            Document(page_content=page.get_text('text'), metadata={'page': i})
+            for i, page in enumerate(pdf)
+        ]
+
+
+class MuPDFLoader(BaseLoader):
+    """PDF loader backed by the MuPDF C library, several times faster than pypdf"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def load(self) -> List[Document]:
+        documents = _mupdf_pages(pymupdf.open(self.file_path))
+        for doc in documents:
+            doc.metadata['source'] = self.file_path
+        return documents
+
+
+def build_pdf_loader(source: str) -> Union[MuPDFLoader, PyPDFLoader]:
+    """Use MuPDF when pymupdf is installed"""
+    if pymupdf is not None:
+        return MuPDFLoader(source)
+    return PyPDFLoader(source)
+
+
+def pdf_stream_documents(file_obj) -> List[Document]:
+    """One document per page of a PDF file object"""
+    if pymupdf is not None:
+        return _mupdf_pages(pymupdf.open(stream=file_obj.read(), filetype='pdf'))
+
+    reader = PdfReader(file_obj)
+    return [
+        Document(page_content=page.extract_text(), metadata={'page': i})
+        for i, page in enumerate(reader.pages)
+    ]
@@ -1,35 +1,121 @@
+import io
 import os
+import csv
+import asyncio
+import hashlib
 import logging
-from typing import List, Optional, Dict, Any
+import threading
+from collections import Counter, defaultdict
+from typing import List, Optional, Dict, Any, BinaryIO, Iterable
 from pathlib import Path
 from urllib.parse import urlparse
 
+import numpy as np
+import requests
 from langchain_core.documents import Document
 from langchain_community.document_loaders import (
-    PyPDFLoader,
     Docx2txtLoader,
     CSVLoader,
     TextLoader,
     WebBaseLoader,
     UnstructuredImageLoader
 )
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders.web_base import default_header_template
+from langchain_text_splitters import TextSplitter
+from ingestion.pdf import build_pdf_loader, pdf_stream_documents
+from ingestion.splitter import build_text_splitter
+from ingestion.web import HTML_PARSER, web_fingerprint
+from retrieval.embeddings import length_sorted_batches
 from retrieval.store import vector_store_manager
 
 logger = logging.getLogger(__name__)
 
 
+def split_into_chunks(text_splitter: TextSplitter, documents: List[Document]) -> List[Document]:
+    """Split documents and attach chunk metadata"""
+    all_chunks = text_splitter.split_documents(documents)
+
+    # Number chunks per source, so multi-page sources get distinct chunk ids
+    totals = Counter(chunk.metadata.get('source') for chunk in all_chunks)
+    next_index = defaultdict(int)
+
+    # Add chunk-specific metadata
+    for chunk in all_chunks:
+        source = chunk.metadata.get('source')
+        index = next_index[source]
+        next_index[source] += 1
+
+        chunk.metadata.update({
+            'chunk_id': f"{source or 'unknown'}_{index}",
+            'chunk_index': index,
+            'total_chunks': totals[source],
+            'original_source': source
+        })
+
+    return all_chunks
+
+
+def content_hash(text: str, source: str = '') -> str:
+    """Stable hash of a chunk's source and content, used as its vector store id"""
+    # The source is part of the id, so no chunk is shared between sources and
+    # one source's stale chunks can be deleted without touching another's.
+    # The hash is fixed, so the same text gets the same id in every process.
+    # The text itself can differ with the optional splitter and parser
+    # backends (semantic-text-splitter, pymupdf, selectolax): installing one
+    # re-embeds a source once, like any other edit to it.
+    data = f"{source}\0{text}".encode('utf-8')
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
 class DocumentIngestionPipeline:
     """Complete document ingestion pipeline for RAG"""
 
+    # Source types load_stream can parse from a file object
+    STREAM_SOURCE_TYPES = ('pdf', 'csv', 'text')
+    # Loading these is dominated by disk reads rather than parsing
+    IO_BOUND_SOURCE_TYPES = ('csv', 'text')
+
+    _TYPE_MAPPING = {
+        '.pdf': 'pdf',
+        '.docx': 'docx',
+        '.doc': 'docx',
+        '.csv': 'csv',
+        '.txt': 'text',
+        '.md': 'text',
+        '.py': 'text',
+        '.json': 'text',
+        '.png': 'image',
+        '.jpg': 'image',
+        '.jpeg': 'image'
+    }
+
+    # Loader factories keyed by source type, each taking the source path or URL
+    _LOADERS = {
+        'pdf': build_pdf_loader,
+        'docx': Docx2txtLoader,
+        'csv': lambda source: CSVLoader(
+            file_path=source,
+            csv_args={
+                'delimiter': ',',
+                'quotechar': '"',
+                'fieldnames': None  # Auto-detect headers
+            }
+        ),
+        'text': lambda source: TextLoader(source, encoding='utf-8'),
+        'web': lambda source: WebBaseLoader(
+            web_paths=[source],
+            default_parser=HTML_PARSER
+        ),
+        'image': UnstructuredImageLoader
+    }
+
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        self.vector_store = vector_store_manager.get_vector_store()
+        self.text_splitter = build_text_splitter(chunk_size=1000, chunk_overlap=200)
+
+    @property
+    def vector_store(self):
+        """Shared Chroma store, resolved on use so the pipeline stays picklable"""
+        return vector_store_manager.get_vector_store()
 
     def load_document(self, source: str, source_type: str = None) -> List[Document]:
         """Load documents from various sources"""
@@ -40,127 +126,331 @@ class DocumentIngestionPipeline:
             loader = self._get_loader(source, source_type)
             documents = loader.load()
 
-            # Add source metadata
-            for doc in documents:
-                doc.metadata.update({
-                    'source': source,
-                    'source_type': source_type,
-                    'ingestion_timestamp': self._get_timestamp()
-                })
-
-            logger.info(f"Loaded {len(documents)} documents from {source}")
-            return documents
+            return self._add_source_metadata(documents, source, source_type)
 
         except Exception as e:
             logger.error(f"Failed to load document from {source}: {e}")
             return []
 
+    def load_stream(self, file_obj: BinaryIO, filename: str,
+                    source_type: str = None) -> List[Document]:
+        """Load documents straight from a binary file object, without a temp file"""
+        try:
+            if source_type is None:
+                source_type = self._detect_source_type(filename)
+
+            if source_type == 'pdf':
+                documents = pdf_stream_documents(file_obj)
+            elif source_type == 'csv':
+                text = io.TextIOWrapper(file_obj, encoding='utf-8', newline='')
+                try:
+                    documents = [
+                        Document(page_content=self._format_csv_row(row), metadata={'row': i})
+                        for i, row in enumerate(csv.DictReader(text))
+                    ]
+                finally:
+                    # Leave the caller's file object open
+                    text.detach()
+            elif source_type == 'text':
+                documents = [Document(page_content=file_obj.read().decode('utf-8'))]
+            else:
+                raise ValueError(f"Unsupported stream source type: {source_type}")
+
+            return self._add_source_metadata(documents, filename, source_type)
+
+        except Exception as e:
+            logger.error(f"Failed to load document from {filename}: {e}")
+            return []
+
+    def _format_csv_row(self, row: Dict[str, Any]) -> str:
+        """Render a CSV row the same way CSVLoader does"""
+        lines = []
+        for key, value in row.items():
+            if isinstance(value, list):
+                value = ','.join(v.strip() for v in value)
+            elif isinstance(value, str):
+                value = value.strip()
+            lines.append(f"{key.strip() if key is not None else key}: {value}")
+        return '\n'.join(lines)
+
+    def _add_source_metadata(self, documents: List[Document], source: str,
+                             source_type: str) -> List[Document]:
+        """Attach source metadata to freshly loaded documents"""
+        for doc in documents:
+            doc.metadata.update({
+                'source': source,
+                'source_type': source_type,
+                'ingestion_timestamp': self._get_timestamp()
+            })
+
+        logger.info(f"Loaded {len(documents)} documents from {source}")
+        return documents
+
+    def _source_fingerprint(self, source: str, source_type: str = None) -> Dict[str, Any]:
+        """Cheap change marker: ETag/Last-Modified for URLs, mtime and size for files"""
+        try:
+            if (source_type or self._detect_source_type(source)) == 'web':
+                response = requests.head(source, headers=default_header_template,
+                                         allow_redirects=True, timeout=10)
+                return web_fingerprint(response.headers)
+
+            stat = os.stat(source)
+            # Integer nanoseconds: float mtimes do not survive a metadata round-trip exactly
+            return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+        except Exception as e:
+            logger.warning(f"Could not fingerprint {source}: {e}")
+            return {}
+
+    def _is_unchanged(self, source: str, fingerprint: Dict[str, Any]) -> bool:
+        """Check whether the stored chunks of a source carry the same fingerprint"""
+        if not fingerprint:
+            return False
+
+        try:
+            stored = self.vector_store._collection.get(
+                where={'original_source': source}, limit=1, include=['metadatas']
+            )
+        except Exception as e:
+            # Ingest as usual, so a store failure is reported like any other
+            logger.warning(f"Could not check stored chunks of {source}: {e}")
+            return False
+
+        if not stored['ids']:
+            return False
+
+        metadata = stored['metadatas'][0]
+        return all(metadata.get(key) == value for key, value in fingerprint.items())
+
+    def _unchanged_result(self, source: str, source_type: str = None) -> Dict[str, Any]:
+        """Result for a source skipped because it has not changed since it was stored"""
+        logger.info(f"Skipping {source}: unchanged since last ingestion")
+        return {
+            'success': True,
+            'cached': True,
+            'message': f'{source} is unchanged since last ingestion',
+            'chunk_count': 0,
+            'processing_summary': {
+                'source': source,
+                'source_type': source_type or self._detect_source_type(source)
+            }
+        }
+
     def _detect_source_type(self, source: str) -> str:
         """Auto-detect source type based on file extension or URL"""
         if source.startswith(('http://', 'https://')):
             return 'web'
-
-        path = Path(source)
-        extension = path.suffix.lower()
-
-        type_mapping = {
-            '.pdf': 'pdf',
-            '.docx': 'docx',
-            '.doc': 'docx',
-            '.csv': 'csv',
-            '.txt': 'text',
-            '.md': 'text',
-            '.py': 'text',
-            '.json': 'text',
-            '.png': 'image',
-            '.jpg': 'image',
-            '.jpeg': 'image'
-        }
-
-        return type_mapping.get(extension, 'text')
+        return self._TYPE_MAPPING.get(Path(source).suffix.lower(), 'text')
 
     def _get_loader(self, source: str, source_type: str):
         """Get appropriate document loader based on source type"""
-        loaders = {
-            'pdf': lambda: PyPDFLoader(source),
-            'docx': lambda: Docx2txtLoader(source),
-            'csv': lambda: CSVLoader(
-                file_path=source,
-                csv_args={
-                    'delimiter': ',',
-                    'quotechar': '"',
-                    'fieldnames': None  # Auto-detect headers
-                }
-            ),
-            'text': lambda: TextLoader(source, encoding='utf-8'),
-            'web': lambda: WebBaseLoader(
-                web_paths=[source],
-                bs_kwargs={
-                    'features': 'html.parser'
-                }
-            ),
-            'image': lambda: UnstructuredImageLoader(source)
-        }
-
-        if source_type not in loaders:
+        if source_type not in self._LOADERS:
             raise ValueError(f"Unsupported source type: {source_type}")
 
-        return loaders[source_type]()
+        return self._LOADERS[source_type](source)
 
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """Split documents into chunks with metadata preservation"""
-        all_chunks = []
-
-        for doc in documents:
-            chunks = self.text_splitter.split_documents([doc])
-
-            # Add chunk-specific metadata
-            for i, chunk in enumerate(chunks):
-                chunk.metadata.update({
-                    'chunk_id': f"{doc.metadata.get('source', 'unknown')}_{i}",
-                    'chunk_index': i,
-                    'total_chunks': len(chunks),
-                    'original_source': doc.metadata.get('source')
-                })
-                all_chunks.append(chunk)
+        all_chunks = split_into_chunks(self.text_splitter, documents)
 
         logger.info(f"Created {len(all_chunks)} chunks from {len(documents)} documents")
         return all_chunks
 
-    def store_documents(self, documents: List[Document]) -> Dict[str, Any]:
-        """Store document chunks in vector store"""
+    def store_documents(self, documents: List[Document], batch_size: int = 64) -> Dict[str, Any]:
+        """Store document chunks in vector store, embedding them in mini-batches"""
         if not documents:
             return {'success': False, 'message': 'No documents to store'}
 
         try:
-            # Generate unique IDs for each chunk
-            ids = [doc.metadata.get('chunk_id', f"chunk_{i}")
-                   for i, doc in enumerate(documents)]
-
-            # Add documents to vector store
-            self.vector_store.add_documents(documents=documents, ids=ids)
-
-            result = {
-                'success': True,
-                'message': f'Successfully stored {len(documents)} document chunks',
-                'chunk_count': len(documents),
-                'sources': list(set(doc.metadata.get('original_source')
-                                    for doc in documents))
-            }
+            # Skip chunks whose content is already stored
+            new_documents = self._filter_new_chunks(documents)
+            ids = [doc.metadata['content_hash'] for doc in new_documents]
 
-            logger.info(result['message'])
-            return result
+            vectors = self._embed_documents(new_documents, batch_size)
+
+            upsert_batch_size = vector_store_manager.upsert_batch_size
+            with vector_store_manager.deferred_index_sync(len(new_documents)):
+                for start in range(0, len(new_documents), upsert_batch_size):
+                    self._upsert_to_collection(
+                        ids[start:start + upsert_batch_size],
+                        new_documents[start:start + upsert_batch_size],
+                        vectors[start:start + upsert_batch_size]
+                    )
+
+            return self._stored_result(documents, new_documents)
 
         except Exception as e:
             error_msg = f"Failed to store documents: {e}"
             logger.error(error_msg)
             return {'success': False, 'message': error_msg}
 
+    async def _astore_documents(self, documents: List[Document], batch_size: int = 64,
+                                max_concurrency: int = 16) -> Dict[str, Any]:
+        """Store document chunks with concurrent mini-batch embedding requests"""
+        if not documents:
+            return {'success': False, 'message': 'No documents to store'}
+
+        try:
+            new_documents = await asyncio.to_thread(self._filter_new_chunks, documents)
+            ids = [doc.metadata['content_hash'] for doc in new_documents]
+
+            vectors = await self._aembed_documents(new_documents, batch_size, max_concurrency)
+
+            upsert_batch_size = vector_store_manager.upsert_batch_size
+            async with vector_store_manager.adeferred_index_sync(len(new_documents)):
+                for start in range(0, len(new_documents), upsert_batch_size):
+                    await asyncio.to_thread(
+                        self._upsert_to_collection,
+                        ids[start:start + upsert_batch_size],
+                        new_documents[start:start + upsert_batch_size],
+                        vectors[start:start + upsert_batch_size]
+                    )
+
+            return self._stored_result(documents, new_documents)
+
+        except Exception as e:
+            error_msg = f"Failed to store documents: {e}"
+            logger.error(error_msg)
+            return {'success': False, 'message': error_msg}
+
+    def _embed_documents(self, documents: List[Document], batch_size: int) -> np.ndarray:
+        """Embed chunks in length-sorted mini-batches, returning vectors in input order"""
+        texts = [doc.page_content for doc in documents]
+        embeddings = self.vector_store.embeddings
+
+        batches = length_sorted_batches(texts, batch_size)
+        results = (embeddings.embed_documents([texts[i] for i in batch]) for batch in batches)
+        return self._gather_vectors(len(texts), batches, results)
+
+    async def _aembed_documents(self, documents: List[Document], batch_size: int,
+                                max_concurrency: int) -> np.ndarray:
+        """Embed length-sorted mini-batches concurrently, returning vectors in input order"""
+        texts = [doc.page_content for doc in documents]
+        embeddings = self.vector_store.embeddings
+        batches = length_sorted_batches(texts, batch_size)
+
+        # Overlap embedding round-trips, capped to avoid flooding the endpoint
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def embed(batch: List[int]) -> List[List[float]]:
+            async with semaphore:
+                return await embeddings.aembed_documents([texts[i] for i in batch])
+
+        results = await asyncio.gather(*[embed(batch) for batch in batches])
+        return self._gather_vectors(len(texts), batches, results)
+
+    def _gather_vectors(self, count: int, batches: List[List[int]],
+                        results: Iterable[List[List[float]]]) -> np.ndarray:
+        """Scatter per-batch embeddings into one contiguous float32 array in input order.
+
+        Chroma takes the array as-is, so vectors never live as lists of
+        boxed Python floats on the way to the collection.
+        """
+        vectors = None
+        for batch, batch_vectors in zip(batches, results):
+            batch_vectors = np.asarray(batch_vectors, dtype=np.float32)
+            if vectors is None:
+                vectors = np.empty((count, batch_vectors.shape[1]), dtype=np.float32)
+            vectors[batch] = batch_vectors
+
+        if vectors is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return vectors
+
+    def _upsert_to_collection(self, ids: List[str], documents: List[Document],
+                              vectors: np.ndarray) -> None:
+        """Write pre-computed embeddings straight to the Chroma collection"""
+        self.vector_store._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents]
+        )
+
+    def _filter_new_chunks(self, documents: List[Document]) -> List[Document]:
+        """Tag chunks with a content hash and drop ones already in the collection"""
+        unique = {}
+        for doc in documents:
+            doc.metadata['content_hash'] = content_hash(doc.page_content,
+                                                        doc.metadata.get('original_source') or '')
+            unique.setdefault(doc.metadata['content_hash'], doc)
+
+        ids = list(unique)
+        collection = self.vector_store._collection
+        # Chroma caps the ids per call; a large source can exceed it
+        batch_size = vector_store_manager.max_batch_size
+        for start in range(0, len(ids), batch_size):
+            existing = collection.get(ids=ids[start:start + batch_size], include=[])
+            for chunk_hash in existing['ids']:
+                unique.pop(chunk_hash, None)
+
+        return list(unique.values())
+
+    def _finalize_source(self, source: str, chunks: List[Document],
+                         fingerprint: Dict[str, Any]) -> None:
+        """Replace a fully stored source's old chunks and stamp its fingerprint.
+
+        Chunks are written without the fingerprint and only receive it here,
+        after every one of them is stored, so a source whose ingest failed
+        part-way is never mistaken for an unchanged one.
+        """
+        ids = list(dict.fromkeys(chunk.metadata['content_hash'] for chunk in chunks))
+        current = set(ids)
+        collection = self.vector_store._collection
+
+        # Delete stored chunks the new version of the source no longer has
+        stored = collection.get(where={'original_source': source}, include=[])
+        stale = [chunk_id for chunk_id in stored['ids'] if chunk_id not in current]
+        if stale:
+            batch_size = vector_store_manager.max_batch_size
+            for start in range(0, len(stale), batch_size):
+                collection.delete(ids=stale[start:start + batch_size])
+            logger.info(f"Removed {len(stale)} stale chunks of {source}")
+
+        if not fingerprint:
+            return
+
+        # Chunks kept from an earlier version still carry its fingerprint
+        batch_size = vector_store_manager.upsert_batch_size
+        for start in range(0, len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            collection.update(ids=batch_ids, metadatas=[fingerprint] * len(batch_ids))
+
+    def _stored_result(self, documents: List[Document],
+                       stored: List[Document]) -> Dict[str, Any]:
+        """Build the success result for a set of chunks, of which `stored` were new"""
+        result = {
+            'success': True,
+            'message': f'Successfully stored {len(stored)} document chunks',
+            'chunk_count': len(stored),
+            'skipped_chunks': len(documents) - len(stored),
+            'sources': list(set(doc.metadata.get('original_source')
+                                for doc in documents))
+        }
+
+        logger.info(result['message'])
+        return result
+
     def process_source(self, source: str, source_type: str = None) -> Dict[str, Any]:
         """Complete pipeline: load -> split -> store"""
+        fingerprint = self._source_fingerprint(source, source_type)
+        if self._is_unchanged(source, fingerprint):
+            return self._unchanged_result(source, source_type)
+
+        documents = self.load_document(source, source_type)
+        return self._process_documents(documents, source, source_type, fingerprint)
+
+    def process_stream(self, file_obj: BinaryIO, filename: str,
+                       source_type: str = None) -> Dict[str, Any]:
+        """Complete pipeline for an uploaded file object: load -> split -> store"""
+        documents = self.load_stream(file_obj, filename, source_type)
+        return self._process_documents(documents, filename, source_type)
+
+    def _process_documents(self, documents: List[Document], source: str,
+                           source_type: str = None,
+                           fingerprint: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Split and store loaded documents, finalizing the source when a fingerprint is given"""
         try:
-            # Load documents
-            documents = self.load_document(source, source_type)
             if not documents:
                 return {'success': False, 'message': 'No documents loaded'}
 
@@ -171,6 +461,8 @@ class DocumentIngestionPipeline:
 
             # Store in vector database
             result = self.store_documents(chunks)
+            if fingerprint is not None and result['success']:
+                self._finalize_source(source, chunks, fingerprint)
 
             # Add processing summary
             result['processing_summary'] = {
@@ -187,19 +479,65 @@ class DocumentIngestionPipeline:
             logger.error(error_msg)
             return {'success': False, 'message': error_msg}
 
+    async def aprocess_source(self, source: str, source_type: str = None) -> Dict[str, Any]:
+        """Async pipeline: load -> split -> concurrent embed and store"""
+        # Loaders and the splitter are blocking, keep them off the event loop
+        fingerprint = await asyncio.to_thread(self._source_fingerprint, source, source_type)
+        if await asyncio.to_thread(self._is_unchanged, source, fingerprint):
+            return self._unchanged_result(source, source_type)
+
+        documents = await asyncio.to_thread(self.load_document, source, source_type)
+        return await self._aprocess_documents(documents, source, source_type, fingerprint)
+
+    async def aprocess_stream(self, file_obj: BinaryIO, filename: str,
+                              source_type: str = None) -> Dict[str, Any]:
+        """Async pipeline for an uploaded file object"""
+        documents = await asyncio.to_thread(self.load_stream, file_obj, filename, source_type)
+        return await self._aprocess_documents(documents, filename, source_type)
+
+    async def _aprocess_documents(self, documents: List[Document], source: str,
+                                  source_type: str = None,
+                                  fingerprint: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Split loaded documents and store them with concurrent embedding"""
+        try:
+            if not documents:
+                return {'success': False, 'message': 'No documents loaded'}
+
+            chunks = await asyncio.to_thread(self.split_documents, documents)
+            if not chunks:
+                return {'success': False, 'message': 'No chunks created'}
+
+            result = await self._astore_documents(chunks)
+            if fingerprint is not None and result['success']:
+                await asyncio.to_thread(self._finalize_source, source, chunks, fingerprint)
+
+            result['processing_summary'] = {
+                'source': source,
+                'source_type': source_type or self._detect_source_type(source),
+                'original_documents': len(documents),
+                'total_chunks': len(chunks)
+            }
+
+            return result
+
+        except Exception as e:
+            error_msg = f"Pipeline failed for {source}: {e}"
+            logger.error(error_msg)
+            return {'success': False, 'message': error_msg}
+
     def process_multiple_sources(self, sources: List[Dict[str, str]]) -> Dict[str, Any]:
-        """Process multiple sources in batch"""
+        """Process multiple sources in batch through the staged async pipeline"""
+        from ingestion.async_pipeline import run_staged_ingestion
+
+        source_results = asyncio.run(run_staged_ingestion(self, sources))
+
         results = []
         total_chunks = 0
         successful_sources = 0
 
-        for source_config in sources:
-            source = source_config.get('source')
-            source_type = source_config.get('type')
-
-            result = self.process_source(source, source_type)
+        for source_config, result in zip(sources, source_results):
             results.append({
-                'source': source,
+                'source': source_config.get('source'),
                 'result': result
             })
 
@@ -225,5 +563,15 @@ class DocumentIngestionPipeline:
         return datetime.now().isoformat()
 
 
-# Global instance
-ingestion_pipeline = DocumentIngestionPipeline()
+# Process-local instance, created on first use rather than at import time
+_ingestion_pipeline = None
+_ingestion_pipeline_lock = threading.Lock()
+
+
+def get_ingestion_pipeline() -> DocumentIngestionPipeline:
+    """Return the shared ingestion pipeline, creating it on first call"""
+    global _ingestion_pipeline
+    with _ingestion_pipeline_lock:
+        if _ingestion_pipeline is None:
+            _ingestion_pipeline = DocumentIngestionPipeline()
+        return _ingestion_pipeline
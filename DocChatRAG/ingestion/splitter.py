@@ -0,0 +1,57 @@
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+try:
+    from semantic_text_splitter import TextSplitter as SemanticTextSplitter
+except ImportError:
+    SemanticTextSplitter = None
+
+
+class RustTextSplitter(TextSplitter):
+    """Character-capacity splitter backed by semantic-text-splitter's Rust core"""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, **kwargs):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        self._splitter = SemanticTextSplitter(chunk_size, overlap=chunk_overlap)
+
+    def split_text(self, text: str) -> List[str]:
+        return self._splitter.chunks(text)
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        # The Rust splitter releases the GIL, so documents are split in parallel threads
+        with ThreadPoolExecutor() as executor:
+            chunk_texts = list(executor.map(self.split_text,
+                                            [doc.page_content for doc in documents]))
+
+        return [
+            Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata))
+            for doc, chunks in zip(documents, chunk_texts)
+            for chunk in chunks
+        ]
+
+    def __getstate__(self):
+        # The native splitter cannot be pickled; rebuild it in worker processes
+        state = self.__dict__.copy()
+        del state['_splitter']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._splitter = SemanticTextSplitter(self._chunk_size, overlap=self._chunk_overlap)
+
+
+def build_text_splitter(chunk_size: int = 1000, chunk_overlap: int = 200) -> TextSplitter:
+    """Use the Rust splitter when semantic-text-splitter is installed"""
+    if SemanticTextSplitter is not None:
+        return RustTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", " ", ""]
+    )
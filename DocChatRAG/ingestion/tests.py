@@ -1,3 +1,134 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import retrieval.store as store
+from ingestion.pipeline import DocumentIngestionPipeline, content_hash
+from retrieval.store import vector_store_manager
+
+
+def write_text(path, paragraphs):
+    with open(path, 'w') as f:
+        f.write('\n\n'.join(paragraphs))
+
+
+def write_pdf(path, text):
+    """Write a one-page PDF showing a single line of text"""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, xref
+    )
+    with open(path, 'wb') as f:
+        f.write(pdf)
+
+
+def paragraphs(prefix, count=5):
+    return [f"{prefix} paragraph {i}. " + f"{prefix}{i} " * 150 for i in range(count)]
+
+
+class StagedIngestionTests(SimpleTestCase):
+    """process_multiple_sources against a throwaway local Chroma store"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+        # Fresh client, collection and fake embeddings for every test
+        patches = [
+            mock.patch.dict(os.environ, {'CHROMA_PERSIST_DIR': os.path.join(self.tmp, 'chroma')}),
+            mock.patch.object(store, '_client', None),
+            mock.patch.object(vector_store_manager, '_vector_store', None),
+            mock.patch.object(vector_store_manager, '_embeddings', DeterministicFakeEmbedding(size=8)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.pipeline = DocumentIngestionPipeline()
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def ingest(self, *sources):
+        summary = self.pipeline.process_multiple_sources([{'source': s} for s in sources])
+        return {r['source']: r['result'] for r in summary['detailed_results']}
+
+    def stored(self, source):
+        collection = self.pipeline.vector_store._collection
+        return collection.get(where={'original_source': source}, include=['documents'])
+
+    def test_mixed_sources(self):
+        text, csv, pdf = self.path('notes.txt'), self.path('table.csv'), self.path('report.pdf')
+        write_text(text, paragraphs('notes'))
+        with open(csv, 'w') as f:
+            f.write("name,role\nada,engineer\ngrace,admiral\n")
+        write_pdf(pdf, "Quarterly report on vector search")
+
+        results = self.ingest(text, csv, pdf)
+
+        for source in (text, csv, pdf):
+            self.assertTrue(results[source]['success'], results[source])
+            self.assertEqual(results[source]['chunk_count'], len(self.stored(source)['ids']))
+        self.assertEqual(results[csv]['processing_summary']['source_type'], 'csv')
+        self.assertEqual(results[csv]['chunk_count'], 2)
+        self.assertEqual(results[pdf]['processing_summary']['source_type'], 'pdf')
+        self.assertIn('Quarterly report', self.stored(pdf)['documents'][0])
+
+    def test_unchanged_rerun_is_cached(self):
+        text = self.path('notes.txt')
+        write_text(text, paragraphs('notes'))
+        first = self.ingest(text)[text]
+
+        second = self.ingest(text)[text]
+
+        self.assertTrue(second['success'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(len(self.stored(text)['ids']), first['chunk_count'])
+
+    def test_failed_source_does_not_fail_others(self):
+        good, missing = self.path('good.txt'), self.path('missing.txt')
+        write_text(good, paragraphs('good'))
+
+        results = self.ingest(good, missing)
+
+        self.assertTrue(results[good]['success'])
+        self.assertGreater(results[good]['chunk_count'], 0)
+        self.assertFalse(results[missing]['success'])
+        self.assertEqual(self.stored(missing)['ids'], [])
+
+    def test_changed_source_replaces_stale_chunks(self):
+        text = self.path('notes.txt')
+        write_text(text, paragraphs('old'))
+        self.ingest(text)
+
+        write_text(text, paragraphs('new', count=3))
+        result = self.ingest(text)[text]
+
+        self.assertTrue(result['success'])
+        stored = self.stored(text)
+        self.assertEqual(result['chunk_count'], len(stored['ids']))
+        self.assertFalse(any('old' in document for document in stored['documents']))
+        self.assertEqual(
+            set(stored['ids']),
+            {content_hash(document, text) for document in stored['documents']}
+        )
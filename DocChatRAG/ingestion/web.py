@@ -0,0 +1,75 @@
+import importlib.util
+from typing import List, Dict, Any, Mapping
+
+import httpx
+from langchain_core.documents import Document
+from langchain_community.document_loaders.web_base import default_header_template
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+# lxml is several times faster than Python's built-in html.parser
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+
+def html_to_documents(html: str, url: str) -> List[Document]:
+    """Extract page text and title, using selectolax when it is installed"""
+    if HTMLParser is not None:
+        tree = HTMLParser(html)
+        title = tree.css_first('title')
+        text = tree.text()
+        title = title.text() if title is not None else None
+    else:
+        # bs4 is optional as well, imported only when selectolax is missing
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, HTML_PARSER)
+        text = soup.get_text()
+        title = soup.title.get_text() if soup.title is not None else None
+
+    metadata = {'source': url}
+    if title:
+        metadata['title'] = title
+
+    return [Document(page_content=text, metadata=metadata)]
+
+
+def web_fingerprint(headers: Mapping[str, str]) -> Dict[str, Any]:
+    """Pick the validators that tell whether a page changed from response headers"""
+    fingerprint = {}
+    if headers.get('ETag'):
+        fingerprint['etag'] = headers['ETag']
+    if headers.get('Last-Modified'):
+        fingerprint['last_modified'] = headers['Last-Modified']
+    return fingerprint
+
+
+def async_web_client(max_connections: int = 16) -> httpx.AsyncClient:
+    """Shared async HTTP client for bulk URL ingestion"""
+    return httpx.AsyncClient(
+        # HTTP/2 needs the optional h2 package
+        http2=importlib.util.find_spec('h2') is not None,
+        # Connection is a hop-by-hop header that HTTP/2 forbids
+        headers={k: v for k, v in default_header_template.items() if k != 'Connection'},
+        follow_redirects=True,
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=max_connections)
+    )
+
+
+async def afetch_web_documents(client: httpx.AsyncClient, url: str) -> List[Document]:
+    """Fetch one URL and convert it into documents"""
+    response = await client.get(url)
+    response.raise_for_status()
+    return html_to_documents(response.text, url)
+
+
+async def afetch_web_fingerprint(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+    """HEAD a URL for its change validators; empty if the server will not say"""
+    try:
+        response = await client.head(url)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    return web_fingerprint(response.headers)
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEndpointEmbeddings
+
+
+def length_sorted_batches(texts: List[str], batch_size: int) -> List[List[int]]:
+    """Group text indices into batches of similar length.
+
+    Uniform batches avoid padding waste and stragglers on the embedding
+    endpoint; callers use the indices to put results back in input order.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size]
+            for start in range(0, len(order), batch_size)]
+
+
+def cuda_available() -> bool:
+    """Check whether a CUDA device and sentence-transformers are usable"""
+    try:
+        import torch
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+class GPUEmbeddings(Embeddings):
+    """Sentence-transformers model run locally on a CUDA device in FP16"""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-mpnet-base-v2",
+                 batch_size: int = 256):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """Load the model onto the GPU on first use"""
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+                self._model = SentenceTransformer(self.model_name, device="cuda").half()
+            return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = [None] * len(texts)
+
+        for batch in length_sorted_batches(texts, self.batch_size):
+            encoded = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                convert_to_tensor=True,
+                normalize_embeddings=True
+            ).float().cpu().numpy()
+            for i, vector in zip(batch, encoded):
+                vectors[i] = vector.tolist()
+
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class PooledHuggingFaceEndpointEmbeddings(HuggingFaceEndpointEmbeddings):
+    """HuggingFace endpoint embeddings whose async calls reuse keep-alive connections.
+
+    huggingface_hub's AsyncInferenceClient opens a new aiohttp session, and so
+    a new TCP+TLS connection, for every request. The sync client keeps a
+    pooled requests.Session per thread, so async calls run it on the default
+    executor's long-lived threads instead.
+    """
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
@@ -1,42 +1,172 @@
 import os
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
 import chromadb
+from chromadb.config import Settings
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
+from langchain_community.embeddings import FastEmbedEmbeddings
 from django.conf import settings
+from retrieval.embeddings import GPUEmbeddings, PooledHuggingFaceEndpointEmbeddings, cuda_available
+
+# HNSW settings for newly created local collections: a denser graph for
+# recall, and less frequent persistence syncs during writes. Existing
+# collections keep the settings they were created with.
+HNSW_METADATA = {
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:sync_threshold": 10000,
+    "hnsw:batch_size": 1000
+}
+
+# Writes larger than this defer the HNSW persistence sync until they finish
+BULK_WRITE_THRESHOLD = 1000
+
+# One Chroma client per process, shared by every VectorStore
+_client = None
+_client_lock = threading.Lock()
 
 
 class VectorStore:
     def __init__(self):
+        self._embeddings = None
+        self._embeddings_lock = threading.Lock()
+        self.collection_name = os.getenv("CHROMA_COLLECTION", "docchat")
+        # Chroma Cloud writes go over HTTP, so keep its request bodies smaller
+        self.upsert_batch_size = int(os.getenv(
+            "CHROMA_UPSERT_BATCH", "64" if self._is_chroma_cloud() else "256"
+        ))
+        self._vector_store = None
+        self._lock = threading.Lock()
+        self._bulk_write_lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        """Embedding backend, chosen on first use.
+
+        Probing for CUDA imports torch, so it must not run when this module
+        is imported by every web worker and loader process.
+        """
+        with self._embeddings_lock:
+            if self._embeddings is None:
+                self._embeddings = self._build_embeddings()
+            return self._embeddings
+
+    def _build_embeddings(self):
+        """Pick local, GPU or endpoint embeddings from the environment"""
+        if os.getenv("USE_LOCAL_EMBEDDINGS", "").lower() in ("1", "true", "yes"):
+            # Quantized ONNX model run in-process, no HTTP round-trip per batch.
+            # Its vectors differ from the endpoint model's, so point
+            # CHROMA_COLLECTION at a separate collection when switching.
+            return FastEmbedEmbeddings(
+                model_name=os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+                batch_size=64
+            )
+        if cuda_available():
+            # Same model as the endpoint, so existing collections stay compatible
+            return GPUEmbeddings("sentence-transformers/all-mpnet-base-v2")
         # HuggingFace Endpoint Embeddings using API
-        self.embeddings = HuggingFaceEndpointEmbeddings(
+        return PooledHuggingFaceEndpointEmbeddings(
             model="sentence-transformers/all-mpnet-base-v2",  # or your preferred embedding model
             task="feature-extraction",
             huggingfacehub_api_token=os.getenv("HUGGINGFACEHUB_API_TOKEN")
         )
-        self.collection_name = "docchat"
-        self._vector_store = None
+
+    @property
+    def max_batch_size(self):
+        """Most ids the Chroma client accepts in a single call"""
+        return self._get_client().get_max_batch_size()
 
     def get_vector_store(self):
         """Initialize and return Chroma vector store"""
-        if self._vector_store is None:
-            if self._is_chroma_cloud():
-                # Chroma Cloud setup
+        # Guard first-use initialization against concurrent requests
+        with self._lock:
+            if self._vector_store is None:
                 self._vector_store = Chroma(
                     collection_name=self.collection_name,
                     embedding_function=self.embeddings,
-                    chroma_cloud_api_key=os.getenv("CHROMA_API_KEY"),
-                    tenant=os.getenv("CHROMA_TENANT"),
-                    database=os.getenv("CHROMA_DATABASE")
+                    client=self._get_client(),
+                    # Chroma Cloud indexes with SPANN, HNSW settings only apply locally
+                    collection_metadata=None if self._is_chroma_cloud() else HNSW_METADATA
                 )
-            else:
-                # Local Chroma setup for development
-                persist_directory = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
-                self._vector_store = Chroma(
-                    collection_name=self.collection_name,
-                    embedding_function=self.embeddings,
-                    persist_directory=persist_directory
-                )
-        return self._vector_store
+            return self._vector_store
+
+    @contextmanager
+    def deferred_index_sync(self, chunk_count):
+        """Hold off HNSW persistence syncs until a bulk write of chunk_count finishes"""
+        sync_threshold = self._deferred_sync_threshold(chunk_count)
+        if sync_threshold is None:
+            yield
+            return
+
+        # Serialize bulk writes so one cannot restore another's raised threshold
+        with self._bulk_write_lock:
+            restore = self._set_sync_threshold(sync_threshold)
+            try:
+                yield
+            finally:
+                self._set_sync_threshold(restore)
+
+    @asynccontextmanager
+    async def adeferred_index_sync(self, chunk_count):
+        """deferred_index_sync for writes awaited on an event loop"""
+        sync_threshold = await asyncio.to_thread(self._deferred_sync_threshold, chunk_count)
+        if sync_threshold is None:
+            yield
+            return
+
+        # Poll rather than block: the loop keeps running, and a cancelled
+        # wait cannot leave the lock acquired by an orphaned thread
+        while not self._bulk_write_lock.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+        try:
+            restore = await asyncio.to_thread(self._set_sync_threshold, sync_threshold)
+            try:
+                yield
+            finally:
+                await asyncio.to_thread(self._set_sync_threshold, restore)
+        finally:
+            self._bulk_write_lock.release()
+
+    def _deferred_sync_threshold(self, chunk_count):
+        """Sync threshold to hold during a bulk write, or None if it should not be raised"""
+        if chunk_count <= BULK_WRITE_THRESHOLD:
+            return None
+        sync_threshold = chunk_count + 1
+
+        hnsw = (self.get_vector_store()._collection.configuration or {}).get("hnsw")
+        if not hnsw or hnsw["sync_threshold"] >= sync_threshold:
+            return None
+        return sync_threshold
+
+    def _set_sync_threshold(self, sync_threshold):
+        """Set the collection's HNSW sync threshold, returning the previous one"""
+        collection = self.get_vector_store()._collection
+        previous = collection.configuration["hnsw"]["sync_threshold"]
+        collection.modify(configuration={"hnsw": {"sync_threshold": sync_threshold}})
+        return previous
+
+    def _get_client(self):
+        """Return the process-wide Chroma client, creating it on first use"""
+        global _client
+        with _client_lock:
+            if _client is None:
+                client_settings = Settings(anonymized_telemetry=False)
+                if self._is_chroma_cloud():
+                    # Chroma Cloud setup
+                    _client = chromadb.CloudClient(
+                        tenant=os.getenv("CHROMA_TENANT"),
+                        database=os.getenv("CHROMA_DATABASE"),
+                        api_key=os.getenv("CHROMA_API_KEY"),
+                        settings=client_settings
+                    )
+                else:
+                    # Local Chroma setup for development
+                    _client = chromadb.PersistentClient(
+                        path=os.getenv("CHROMA_PERSIST_DIR", "./chroma_db"),
+                        settings=client_settings
+                    )
+            return _client
 
     def _is_chroma_cloud(self):
         """Check if Chroma Cloud credentials are available"""